@@ -16,9 +16,12 @@ setup(
         "OpenAIAuth==0.3.2",
         "requests",
         "asyncio",
-        "httpx",
+        "httpx[http2]>=0.26",
     ],
     extras_require={
+        "fast": [
+            "orjson",
+        ],
         "unofficial": [
             "requests",
             "undetected_chromedriver",
@@ -3,28 +3,54 @@ Standard ChatGPT
 """
 from __future__ import annotations
 
+import asyncio
+import atexit
 import json
 import logging
+import threading
 import time
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from functools import wraps
 from os import environ
 from os import getenv
+from urllib.parse import urlsplit
+from urllib.request import getproxies
+from urllib.request import proxy_bypass
 import os
 import os.path as osp
 import base64
 
-import requests
 from httpx import AsyncClient
+from httpx import Client
+from httpx import HTTPTransport
+from httpx import Limits
+from httpx import Proxy
 from OpenAIAuth import Authenticator
 from OpenAIAuth import Error as AuthError
 
+try:
+    from orjson import dumps as _json_dumps
+    from orjson import loads as _json_loads
+except ImportError:
+    # orjson is optional, fall back to the standard library
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+    _json_loads = json.loads
+
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(funcName)s - %(message)s",
 )
 
 log = logging.getLogger(__name__)
 
+# Set CHATGPT_LOG_MODE=release to leave decorated functions unwrapped
+RELEASE = environ.get("CHATGPT_LOG_MODE") == "release"
+
 
 def logger(is_timed: bool):
     """
@@ -32,9 +58,13 @@ def logger(is_timed: bool):
     """
 
     def decorator(func):
-        wraps(func)
+        if RELEASE:
+            return func
 
+        @wraps(func)
         def wrapper(*args, **kwargs):
+            if not log.isEnabledFor(logging.DEBUG):
+                return func(*args, **kwargs)
             log.debug(
                 "Entering %s with args %s and kwargs %s",
                 func.__name__,
@@ -63,6 +93,156 @@ def logger(is_timed: bool):
 
 BASE_URL = environ.get("CHATGPT_BASE_URL") or "https://chatgpt.duti.tech/"
 
+HEADERS = {
+    "Accept": "text/event-stream",
+    "Content-Type": "application/json",
+    "X-Openai-Assistant-App-Id": "",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://chat.openai.com/chat",
+}
+
+# Control lines of the conversation event stream
+_DATA_PREFIX = "data: "
+_DONE = "[DONE]"
+_ISE = "Internal Server Error"
+
+# Minimum number of seconds between two writes of the token cache file
+CACHE_FLUSH_INTERVAL = 5
+
+# Number of UUIDs generated from a single read of random bytes
+UUID_BATCH_SIZE = 64
+_uuid_pool: list[str] = []
+_uuid_lock = threading.Lock()
+
+
+def _reset_uuid_pool() -> None:
+    """
+    Give a forked child its own IDs and a lock no other thread can hold
+    """
+    global _uuid_lock
+    _uuid_lock = threading.Lock()
+    _uuid_pool.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_uuid_pool)
+
+
+def _uuid4() -> str:
+    """
+    Random UUID4 string, drawn from a batch generated with one urandom call
+    """
+    with _uuid_lock:
+        if not _uuid_pool:
+            random_bytes = os.urandom(16 * UUID_BATCH_SIZE)
+            _uuid_pool.extend(
+                str(uuid.UUID(bytes=random_bytes[i : i + 16], version=4))
+                for i in range(0, len(random_bytes), 16)
+            )
+        return _uuid_pool.pop()
+
+
+# HTTP/2 connection pools shared by all synchronous clients, keyed by proxy
+_transports: dict[str | None, HTTPTransport] = {}
+
+
+def _env_proxy(url: str) -> str | None:
+    """
+    Proxy configured in the environment (HTTP(S)_PROXY, NO_PROXY) for a URL
+    :param url: String. URL that will be requested
+    :return: Proxy URL or None for direct connections
+    """
+    parts = urlsplit(url)
+    if parts.hostname is None or proxy_bypass(parts.hostname):
+        return None
+    proxies = getproxies()
+    return proxies.get(parts.scheme) or proxies.get("all")
+
+
+def _get_transport(proxy: str | None) -> HTTPTransport:
+    """
+    Get the shared transport for a proxy, creating it on first use
+    :param proxy: String. Proxy URL or None for direct connections
+    """
+    transport = _transports.get(proxy)
+    if transport is None:
+        transport = _transports[proxy] = HTTPTransport(
+            http2=True,
+            limits=Limits(max_connections=32, max_keepalive_connections=16),
+            retries=2,
+            proxy=Proxy(proxy) if proxy else None,
+        )
+    return transport
+
+
+def _parse_line(line: str) -> dict | str | None:
+    """
+    Parse one line of the conversation event stream
+    :param line: String. Line without the trailing newline
+    :return: The decoded JSON object, _DONE at the end of the stream
+        or None for lines without a payload
+    """
+    if not line:
+        return None
+    if line.startswith(_DATA_PREFIX):
+        line = line[6:]
+    if line == _DONE:
+        return _DONE
+    if line == _ISE:
+        log.error("Internal Server Error: %s", line)
+        raise Exception("Error: " + line)
+    # Only JSON objects carry messages, skip anything else unparsed
+    if not line.startswith("{"):
+        return None
+    try:
+        return _json_loads(line)
+    except json.decoder.JSONDecodeError:
+        return None
+
+
+def _process_frame(line: str, prompt: str | None) -> dict | str | None:
+    """
+    Turn one line of the conversation event stream into an answer
+    :param line: String. Line without the trailing newline
+    :param prompt: String. Prompt whose echo is skipped, None to skip nothing
+    :return: The answer, _DONE at the end of the stream
+        or None for lines without an answer
+    """
+    frame = _parse_line(line)
+    if frame is None or frame is _DONE:
+        return frame
+    msg = frame.get("message")
+    content = msg.get("content") if isinstance(msg, dict) else None
+    if content is None:
+        log.error("Field missing: %s", frame)
+        detail = frame.get("detail")
+        if detail == "Too many requests in 1 hour. Try again later.":
+            log.error("Rate limit exceeded")
+            raise Error(source="ask", message=detail, code=2)
+        if isinstance(detail, dict) and detail.get("code") == "invalid_api_key":
+            log.error("Invalid access token")
+            raise Error(source="ask", message=detail.get("message"), code=3)
+
+        raise Error(source="ask", message="Field missing", code=1)
+    message = content["parts"][0]
+    if message == prompt:
+        return None
+    conversation_id = frame["conversation_id"]
+    parent_id = msg["id"]
+    try:
+        model = msg["metadata"]["model_slug"]
+    except KeyError:
+        model = None
+    log.debug("Received message: %s", message)
+    log.debug("Received conversation_id: %s", conversation_id)
+    log.debug("Received parent_id: %s", parent_id)
+    return {
+        "message": message,
+        "conversation_id": conversation_id,
+        "parent_id": parent_id,
+        "model": model,
+    }
+
 
 class Error(Exception):
     """
@@ -93,6 +273,15 @@ class Chatbot:
     Chatbot class for ChatGPT
     """
 
+    # Parsed cache files shared by all instances, keyed by cache path
+    _cache_data: dict[str, dict] = {}
+    _cache_mtime: dict[str, int] = {}
+    # Token updates not yet written, keyed by cache path and then email
+    _cache_dirty: dict[str, dict[str, str]] = {}
+    _cache_flushed: dict[str, float] = {}
+    # Decoded access tokens, mapping the raw JWT to its expiry and claims
+    _token_claims: dict[str, tuple[int | None, dict]] = {}
+
     @logger(is_timed=True)
     def __init__(
         self,
@@ -101,19 +290,40 @@ class Chatbot:
         parent_id: str | None = None,
         session_client=None,
     ) -> None:
+        """
+        Initialize the chatbot
+        :param config: Dict. Login details and options, see the README
+        :param conversation_id: UUID
+        :param parent_id: UUID
+        :param session_client: Callable returning an httpx Client or
+            AsyncClient. It is called with proxy=config["proxy"] when a
+            proxy is configured
+        """
         user_home = getenv("HOME")
         if user_home is None:
             self.cache_path = ".chatgpt_cache.json"
         else:
-            # mkdir ~/.config/revChatGPT
-            if not osp.exists(osp.join(user_home, ".config")):
-                os.mkdir(osp.join(user_home, ".config"))
-            if not osp.exists(osp.join(user_home, ".config", "revChatGPT")):
-                os.mkdir(osp.join(user_home, ".config", "revChatGPT"))
             self.cache_path = osp.join(user_home, ".config", "revChatGPT", "cache.json")
+            # mkdir ~/.config/revChatGPT
+            os.makedirs(osp.dirname(self.cache_path), exist_ok=True)
 
         self.config = config
-        self.session = session_client() if session_client else requests.Session()
+        if "proxy" in config and not isinstance(config["proxy"], str):
+            raise Exception("Proxy must be a string!")
+        if session_client is None:
+            # The client only holds our headers, connections are pooled.
+            # Passing a transport disables httpx's own environment proxy
+            # lookup, so resolve it here like requests used to.
+            proxy = config.get("proxy") or _env_proxy(BASE_URL)
+            self.session = Client(
+                transport=_get_transport(proxy),
+                timeout=None,
+                follow_redirects=True,
+            )
+        elif "proxy" in config:
+            self.session = session_client(proxy=config["proxy"])
+        else:
+            self.session = session_client()
         try:
             cached_access_token = self.__get_cached_access_token(
                 self.config.get("email", None)
@@ -125,22 +335,17 @@ class Chatbot:
         if cached_access_token is not None:
             self.config["access_token"] = cached_access_token
 
-        if "proxy" in config:
-            if not isinstance(config["proxy"], str):
-                raise Exception("Proxy must be a string!")
-            proxies = {
-                "http": config["proxy"],
-                "https": config["proxy"],
-            }
-            if isinstance(self.session, AsyncClient):
-                self.session = AsyncClient(proxies=proxies)
-            else:
-                self.session.proxies.update(proxies)
         self.conversation_id = conversation_id
         self.parent_id = parent_id
+        self._model = (
+            "text-davinci-002-render-paid"
+            if self.config.get("paid")
+            else "text-davinci-002-render-sha"
+        )
+        self._url = BASE_URL + "api/conversation"
         self.conversation_mapping = {}
-        self.conversation_id_prev_queue = []
-        self.parent_id_prev_queue = []
+        self.conversation_id_prev_queue = deque(maxlen=1024)
+        self.parent_id_prev_queue = deque(maxlen=1024)
 
         self.__check_credentials()
 
@@ -163,17 +368,8 @@ class Chatbot:
     @logger(is_timed=False)
     def __refresh_headers(self, access_token: str):
         self.session.headers.clear()
-        self.session.headers.update(
-            {
-                "Accept": "text/event-stream",
-                "Authorization": f"Bearer {access_token}",
-                "Content-Type": "application/json",
-                "X-Openai-Assistant-App-Id": "",
-                "Connection": "close",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Referer": "https://chat.openai.com/chat",
-            },
-        )
+        self.session.headers.update(HEADERS)
+        self.session.headers["Authorization"] = f"Bearer {access_token}"
         self.config["access_token"] = access_token
 
         email = self.config.get("email", None)
@@ -186,29 +382,8 @@ class Chatbot:
         cache = self.__read_cache()
         access_token = cache.get("access_tokens", {}).get(email, None)
 
-        # Parse access_token as JWT
         if access_token is not None:
-            try:
-                # Split access_token into 3 parts
-                s_access_token = access_token.split(".")
-                # Add padding to the middle part
-                s_access_token[1] += "=" * ((4 - len(s_access_token[1]) % 4) % 4)
-                d_access_token = base64.b64decode(s_access_token[1])
-                d_access_token = json.loads(d_access_token)
-            except base64.binascii.Error:
-                raise Error(
-                    source="__get_cached_access_token",
-                    message="Invalid access token",
-                    code=5,
-                ) from None
-            except json.JSONDecodeError:
-                raise Error(
-                    source="__get_cached_access_token",
-                    message="Invalid access token",
-                    code=5,
-                ) from None
-
-            exp = d_access_token.get("exp", None)
+            exp, _ = self.__decode_access_token(access_token)
             if exp is not None and exp < time.time():
                 raise Error(
                     source="__get_cached_access_token",
@@ -218,27 +393,94 @@ class Chatbot:
 
         return access_token
 
+    @logger(is_timed=False)
+    def __decode_access_token(self, access_token: str) -> tuple[int | None, dict]:
+        # Each token is parsed as JWT only once
+        decoded = self._token_claims.get(access_token)
+        if decoded is not None:
+            return decoded
+        try:
+            # Slice out the payload between the two dots, the signature is unused
+            start = access_token.index(".") + 1
+            payload = access_token[start : access_token.index(".", start)]
+            claims = json.loads(
+                base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)),
+            )
+        except ValueError:
+            # Covers missing dots, binascii.Error and JSONDecodeError
+            raise Error(
+                source="__get_cached_access_token",
+                message="Invalid access token",
+                code=5,
+            ) from None
+        decoded = self._token_claims[access_token] = (claims.get("exp"), claims)
+        return decoded
+
     @logger(is_timed=False)
     def __cache_access_token(self, email: str, access_token: str) -> None:
         email = email or "default"
-        cache = self.__read_cache()
-        if "access_tokens" not in cache:
-            cache["access_tokens"] = {}
-        cache["access_tokens"][email] = access_token
-        self.__write_cache(cache)
+        # __init__ already loaded the cache, update it in memory only
+        cache = self._cache_data.setdefault(self.cache_path, {})
+        cache.setdefault("access_tokens", {})[email] = access_token
+        self._cache_dirty.setdefault(self.cache_path, {})[email] = access_token
+        # Debounce writes, whatever is still pending gets flushed at exit
+        last_flush = self._cache_flushed.get(self.cache_path, 0)
+        if time.time() - last_flush > CACHE_FLUSH_INTERVAL:
+            self._flush_cache(self.cache_path)
+
+    @classmethod
+    def _flush_cache(cls, path: str | None = None) -> None:
+        """
+        Write pending token cache changes to disk
+        :param path: String. Cache file to flush, all pending ones if None
+        """
+        paths = [path] if path is not None else list(cls._cache_dirty)
+        for cache_path in paths:
+            pending = cls._cache_dirty.pop(cache_path, None)
+            if pending is None:
+                continue
+            cache = cls._cache_data[cache_path]
+            # Keep tokens other processes wrote since the file was last read
+            try:
+                mtime = os.stat(cache_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime is not None and mtime != cls._cache_mtime.get(cache_path):
+                cache = cls._cache_data[cache_path] = cls.__load_cache(cache_path)
+                cache.setdefault("access_tokens", {}).update(pending)
+            cls.__write_cache(cache_path, cache)
+            cls._cache_flushed[cache_path] = time.time()
+            cls._cache_mtime[cache_path] = os.stat(cache_path).st_mtime_ns
+
+    @staticmethod
+    @logger(is_timed=False)
+    def __write_cache(path: str, info: dict):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(info, file)
 
+    @staticmethod
     @logger(is_timed=False)
-    def __write_cache(self, info: dict):
-        os.makedirs(osp.dirname(self.cache_path), exist_ok=True)
-        json.dump(info, open(self.cache_path, "w", encoding="utf-8"), indent=4)
+    def __load_cache(path: str) -> dict:
+        try:
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)
+        except json.decoder.JSONDecodeError:
+            return {}
 
     @logger(is_timed=False)
-    def __read_cache(self):
+    def __read_cache(self) -> dict:
+        # Unflushed changes in memory take precedence over the file
+        if self.cache_path in self._cache_dirty:
+            return self._cache_data[self.cache_path]
+        # Only reparse the file when it was modified since the last read
         try:
-            cached = json.load(open(self.cache_path, encoding="utf-8"))
-        except (FileNotFoundError, json.decoder.JSONDecodeError):
-            cached = {}
-        return cached
+            mtime = os.stat(self.cache_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._cache_data.setdefault(self.cache_path, {})
+        if self._cache_mtime.get(self.cache_path) != mtime:
+            self._cache_data[self.cache_path] = self.__load_cache(self.cache_path)
+            self._cache_mtime[self.cache_path] = mtime
+        return self._cache_data[self.cache_path]
 
     @logger(is_timed=True)
     def __login(self):
@@ -294,7 +536,7 @@ class Chatbot:
         conversation_id = conversation_id or self.conversation_id
         parent_id = parent_id or self.parent_id
         if conversation_id is None and parent_id is None:
-            parent_id = str(uuid.uuid4())
+            parent_id = _uuid4()
             log.debug("New conversation, setting parent_id to new UUID4: %s", parent_id)
 
         if conversation_id is not None and parent_id is None:
@@ -315,105 +557,63 @@ class Chatbot:
             "action": "next",
             "messages": [
                 {
-                    "id": str(uuid.uuid4()),
+                    "id": _uuid4(),
                     "role": "user",
                     "content": {"content_type": "text", "parts": [prompt]},
                 },
             ],
             "conversation_id": conversation_id,
             "parent_message_id": parent_id,
-            "model": "text-davinci-002-render-sha"
-            if not self.config.get("paid")
-            else "text-davinci-002-render-paid",
+            "model": self._model,
         }
-        log.debug("Sending the payload")
-        log.debug(json.dumps(data, indent=2))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Sending the payload")
+            log.debug(json.dumps(data, indent=2))
 
         self.conversation_id_prev_queue.append(
             data["conversation_id"],
         )
         self.parent_id_prev_queue.append(data["parent_message_id"])
-        response = self.session.post(
-            url=BASE_URL + "api/conversation",
-            data=json.dumps(data),
+        with self.session.stream(
+            method="POST",
+            url=self._url,
+            content=_json_dumps(data),
             timeout=timeout,
-            stream=True,
-        )
-        self.__check_response(response)
-        for line in response.iter_lines():
-            line = str(line)[2:-1]
-            if line == "Internal Server Error":
-                log.error("Internal Server Error: %s", line)
-                raise Exception("Error: " + str(line))
-            if line == "" or line is None:
-                continue
-            if "data: " in line:
-                line = line[6:]
-            if line == "[DONE]":
-                break
-
-            line = line.replace('\\"', '"')
-            line = line.replace("\\'", "'")
-            line = line.replace("\\\\", "\\")
+        ) as response:
+            self.__check_response(response)
+            # The prompt can only be echoed back before the answer starts
+            echo = prompt
+            for line in response.iter_lines():
+                answer = _process_frame(line, echo)
+                if answer is _DONE:
+                    break
+                if answer is None:
+                    continue
+                echo = None
+                conversation_id = answer["conversation_id"]
+                parent_id = answer["parent_id"]
+                yield answer
+        self._finalize(conversation_id, parent_id)
 
-            try:
-                line = json.loads(line)
-            except json.decoder.JSONDecodeError:
-                continue
-            if not self.__check_fields(line):
-                log.error("Field missing", exc_info=True)
-                if (
-                    line.get("detail")
-                    == "Too many requests in 1 hour. Try again later."
-                ):
-                    log.error("Rate limit exceeded")
-                    raise Error(source="ask", message=line.get("detail"), code=2)
-                if line.get("detail", {}).get("code") == "invalid_api_key":
-                    log.error("Invalid access token")
-                    raise Error(
-                        source="ask",
-                        message=line.get("detail", {}).get("message"),
-                        code=3,
-                    )
-
-                raise Error(source="ask", message="Field missing", code=1)
-            message = line["message"]["content"]["parts"][0]
-            if message == prompt:
-                continue
-            conversation_id = line["conversation_id"]
-            parent_id = line["message"]["id"]
-            try:
-                model = line["message"]["metadata"]["model_slug"]
-            except KeyError:
-                model = None
-            log.debug("Received message: %s", message)
-            log.debug("Received conversation_id: %s", conversation_id)
-            log.debug("Received parent_id: %s", parent_id)
-            yield {
-                "message": message,
-                "conversation_id": conversation_id,
-                "parent_id": parent_id,
-                "model": model,
-            }
+    @logger(is_timed=False)
+    def _finalize(self, conversation_id: str | None, parent_id: str | None) -> None:
+        """
+        Remember where the conversation continues after an answer
+        :param conversation_id: UUID
+        :param parent_id: UUID of the last message
+        :return: None
+        """
         self.conversation_mapping[conversation_id] = parent_id
         if parent_id is not None:
             self.parent_id = parent_id
         if conversation_id is not None:
             self.conversation_id = conversation_id
 
-    @logger(is_timed=False)
-    def __check_fields(self, data: dict) -> bool:
-        try:
-            data["message"]["content"]
-        except TypeError:
-            return False
-        except KeyError:
-            return False
-        return True
-
     @logger(is_timed=False)
     def __check_response(self, response):
         if response.status_code != 200:
+            # Streamed responses have to be read before accessing the text
+            response.read()
             print(response.text)
             raise Error("OpenAI", response.status_code, response.text)
 
@@ -431,7 +631,9 @@ class Chatbot:
         self.__check_response(response)
         if encoding is not None:
             response.encoding = encoding
-        data = json.loads(response.text)
+            data = _json_loads(response.text)
+        else:
+            data = _json_loads(response.content)
         return data["items"]
 
     @logger(is_timed=True)
@@ -446,7 +648,9 @@ class Chatbot:
         self.__check_response(response)
         if encoding is not None:
             response.encoding = encoding
-        data = json.loads(response.text)
+            data = _json_loads(response.text)
+        else:
+            data = _json_loads(response.content)
         return data
 
     @logger(is_timed=True)
@@ -456,7 +660,7 @@ class Chatbot:
         """
         response = self.session.post(
             BASE_URL + f"api/conversation/gen_title/{convo_id}",
-            data=json.dumps(
+            content=_json_dumps(
                 {"message_id": message_id, "model": "text-davinci-002-render"},
             ),
         )
@@ -470,7 +674,7 @@ class Chatbot:
         :param title: String
         """
         url = BASE_URL + f"api/conversation/{convo_id}"
-        response = self.session.patch(url, data=json.dumps({"title": title}))
+        response = self.session.patch(url, content=_json_dumps({"title": title}))
         self.__check_response(response)
 
     @logger(is_timed=True)
@@ -480,7 +684,7 @@ class Chatbot:
         :param id: UUID of conversation
         """
         url = BASE_URL + f"api/conversation/{convo_id}"
-        response = self.session.patch(url, data='{"is_visible": false}')
+        response = self.session.patch(url, content=b'{"is_visible": false}')
         self.__check_response(response)
 
     @logger(is_timed=True)
@@ -489,13 +693,16 @@ class Chatbot:
         Delete all conversations
         """
         url = BASE_URL + "api/conversations"
-        response = self.session.patch(url, data='{"is_visible": false}')
+        response = self.session.patch(url, content=b'{"is_visible": false}')
         self.__check_response(response)
 
     @logger(is_timed=False)
     def __map_conversations(self):
         conversations = self.get_conversations()
-        histories = [self.get_msg_history(x["id"]) for x in conversations]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            histories = list(
+                executor.map(lambda x: self.get_msg_history(x["id"]), conversations),
+            )
         for x, y in zip(conversations, histories):
             self.conversation_mapping[x["id"]] = y["current_node"]
 
@@ -507,7 +714,7 @@ class Chatbot:
         :return: None
         """
         self.conversation_id = None
-        self.parent_id = str(uuid.uuid4())
+        self.parent_id = _uuid4()
 
     @logger(is_timed=False)
     def rollback_conversation(self, num: int = 1) -> None:
@@ -521,6 +728,9 @@ class Chatbot:
             self.parent_id = self.parent_id_prev_queue.pop()
 
 
+atexit.register(Chatbot._flush_cache)
+
+
 class AsyncChatbot(Chatbot):
     """
     Async Chatbot class for ChatGPT
@@ -536,7 +746,11 @@ class AsyncChatbot(Chatbot):
             config=config,
             conversation_id=conversation_id,
             parent_id=parent_id,
-            session_client=AsyncClient,
+            session_client=partial(
+                AsyncClient,
+                http2=True,
+                limits=Limits(max_keepalive_connections=16),
+            ),
         )
 
     async def ask(
@@ -558,26 +772,24 @@ class AsyncChatbot(Chatbot):
         conversation_id = conversation_id or self.conversation_id
         parent_id = parent_id or self.parent_id
         if conversation_id is None and parent_id is None:
-            parent_id = str(uuid.uuid4())
+            parent_id = _uuid4()
 
         if conversation_id is not None and parent_id is None:
             if conversation_id not in self.conversation_mapping:
-                self.__map_conversations()
+                await self.__map_conversations()
             parent_id = self.conversation_mapping[conversation_id]
         data = {
             "action": "next",
             "messages": [
                 {
-                    "id": str(uuid.uuid4()),
+                    "id": _uuid4(),
                     "role": "user",
                     "content": {"content_type": "text", "parts": [prompt]},
                 },
             ],
             "conversation_id": conversation_id,
             "parent_message_id": parent_id,
-            "model": "text-davinci-002-render-sha"
-            if not self.config.get("paid")
-            else "text-davinci-002-render-paid",
+            "model": self._model,
         }
 
         self.conversation_id_prev_queue.append(
@@ -587,41 +799,24 @@ class AsyncChatbot(Chatbot):
 
         async with self.session.stream(
             method="POST",
-            url=BASE_URL + "api/conversation",
-            data=json.dumps(data),
+            url=self._url,
+            content=_json_dumps(data),
             timeout=timeout,
         ) as response:
             self.__check_response(response)
+            # The prompt can only be echoed back before the answer starts
+            echo = prompt
             async for line in response.aiter_lines():
-                if line == "" or line is None:
-                    continue
-                if "data: " in line:
-                    line = line[6:]
-                if "[DONE]" in line:
+                answer = _process_frame(line, echo)
+                if answer is _DONE:
                     break
-
-                try:
-                    line = json.loads(line)
-                except json.decoder.JSONDecodeError:
+                if answer is None:
                     continue
-                if not self.__check_fields(line):
-                    raise Exception("Field missing. Details: " + str(line))
-
-                message = line["message"]["content"]["parts"][0]
-                conversation_id = line["conversation_id"]
-                parent_id = line["message"]["id"]
-                model = line["message"]["metadata"]["model_slug"] if "model_slug" in line["message"]["metadata"] else None
-                yield {
-                    "message": message,
-                    "conversation_id": conversation_id,
-                    "parent_id": parent_id,
-                    "model": model,
-                }
-            self.conversation_mapping[conversation_id] = parent_id
-            if parent_id is not None:
-                self.parent_id = parent_id
-            if conversation_id is not None:
-                self.conversation_id = conversation_id
+                echo = None
+                conversation_id = answer["conversation_id"]
+                parent_id = answer["parent_id"]
+                yield answer
+        self._finalize(conversation_id, parent_id)
 
     async def get_conversations(self, offset=0, limit=20):
         """
@@ -632,7 +827,7 @@ class AsyncChatbot(Chatbot):
         url = BASE_URL + f"api/conversations?offset={offset}&limit={limit}"
         response = await self.session.get(url)
         self.__check_response(response)
-        data = json.loads(response.text)
+        data = _json_loads(response.content)
         return data["items"]
 
     async def get_msg_history(self, convo_id, encoding="utf-8"):
@@ -642,11 +837,13 @@ class AsyncChatbot(Chatbot):
         """
         url = BASE_URL + f"api/conversation/{convo_id}"
         response = await self.session.get(url)
+        self.__check_response(response)
         if encoding is not None:
             response.encoding = encoding
-            self.__check_response(response)
-            data = json.loads(response.text)
-            return data
+            data = _json_loads(response.text)
+        else:
+            data = _json_loads(response.content)
+        return data
 
     async def gen_title(self, convo_id, message_id):
         """
@@ -655,7 +852,7 @@ class AsyncChatbot(Chatbot):
         url = BASE_URL + f"api/conversation/gen_title/{convo_id}"
         response = await self.session.post(
             url,
-            data=json.dumps(
+            content=_json_dumps(
                 {"message_id": message_id, "model": "text-davinci-002-render"},
             ),
         )
@@ -668,7 +865,10 @@ class AsyncChatbot(Chatbot):
         :param title: String
         """
         url = BASE_URL + f"api/conversation/{convo_id}"
-        response = await self.session.patch(url, data=f'{{"title": "{title}"}}')
+        response = await self.session.patch(
+            url,
+            content=_json_dumps({"title": title}),
+        )
         self.__check_response(response)
 
     async def delete_conversation(self, convo_id):
@@ -677,7 +877,7 @@ class AsyncChatbot(Chatbot):
         :param convo_id: UUID of conversation
         """
         url = BASE_URL + f"api/conversation/{convo_id}"
-        response = await self.session.patch(url, data='{"is_visible": false}')
+        response = await self.session.patch(url, content=b'{"is_visible": false}')
         self.__check_response(response)
 
     async def clear_conversations(self):
@@ -685,24 +885,17 @@ class AsyncChatbot(Chatbot):
         Delete all conversations
         """
         url = BASE_URL + "api/conversations"
-        response = await self.session.patch(url, data='{"is_visible": false}')
+        response = await self.session.patch(url, content=b'{"is_visible": false}')
         self.__check_response(response)
 
     async def __map_conversations(self):
         conversations = await self.get_conversations()
-        histories = [await self.get_msg_history(x["id"]) for x in conversations]
+        histories = await asyncio.gather(
+            *(self.get_msg_history(x["id"]) for x in conversations),
+        )
         for x, y in zip(conversations, histories):
             self.conversation_mapping[x["id"]] = y["current_node"]
 
-    def __check_fields(self, data: dict) -> bool:
-        try:
-            data["message"]["content"]
-        except TypeError:
-            return False
-        except KeyError:
-            return False
-        return True
-
     def __check_response(self, response):
         response.raise_for_status()
 